@@ -3,8 +3,13 @@ Cortex Classification Agent
 Uses Claude to classify unstructured text into structured categories.
 """
 
-import json
-from anthropic import Anthropic
+import copy
+import re
+
+import orjson
+
+from agent.client import CACHE_CONTROL, FAST_MODEL, MODEL, create_client
+from cache import TTLCache
 
 CATEGORIES = [
     "task",       # Action items, todos, things to do
@@ -61,41 +66,88 @@ If something is time-sensitive, flag it.
 You speak concisely but with personality. Think of yourself as a brilliant executive
 assistant who actually knows the user well."""
 
+CLASSIFICATION_SYSTEM = [
+    {
+        "type": "text",
+        "text": CLASSIFICATION_SYSTEM_PROMPT.format(categories=", ".join(CATEGORIES)),
+        "cache_control": CACHE_CONTROL,
+    }
+]
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Markdown code fence the model sometimes wraps its JSON in
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*\n?(.*?)\n?```\s*$", re.S)
+
+
+def _cache_key(text: str) -> str:
+    """
+    Normalize text so re-dumps differing only in case, spacing or trailing
+    punctuation share a key. Symbols inside the text ($, %, +, ...) are kept:
+    they change what the entry means.
+    """
+    return _WHITESPACE_RE.sub(" ", text.casefold()).strip().rstrip(".!?,;: ")
+
+
+def is_simple_input(text: str) -> bool:
+    """Short single-sentence inputs don't need the larger model."""
+    return len(text) < 140 and text.count(".") <= 1 and "\n" not in text
+
 
 class CortexClassifier:
     """Classifies unstructured text into structured categories using Claude."""
 
     def __init__(self, api_key: str):
-        self.client = Anthropic(api_key=api_key)
-        self.model = "claude-sonnet-4-20250514"
+        self.client = create_client(api_key)
+        self.model = MODEL
+        self.fast_model = FAST_MODEL
+        # Classification results for recent dumps; entries expire so a
+        # re-dump after a while gets a fresh read (e.g. relative dates)
+        self._cache = TTLCache(maxsize=1024, ttl=600)
 
     def classify(self, text: str) -> dict:
-        """Classify raw text into a structured entry."""
+        """Classify raw text into a structured entry.
+        Repeated (or near-identical) dumps are served from an LRU cache."""
+        key = _cache_key(text)
+        cached = self._cache.get(key)
+        if cached is not None:
+            # Callers mutate entries (ids, embeddings), so hand out a copy
+            result = copy.deepcopy(cached)
+            result["raw_input"] = text
+            return result
+
+        model = self.fast_model if is_simple_input(text) else self.model
         response = self.client.messages.create(
-            model=self.model,
+            model=model,
             max_tokens=1024,
-            system=CLASSIFICATION_SYSTEM_PROMPT.format(
-                categories=", ".join(CATEGORIES)
-            ),
+            system=CLASSIFICATION_SYSTEM,
             messages=[{"role": "user", "content": text}],
         )
 
         raw = response.content[0].text.strip()
 
         # Handle potential markdown code blocks in response
-        if raw.startswith("```"):
-            raw = raw.split("\n", 1)[1]  # Remove first line
-            raw = raw.rsplit("```", 1)[0]  # Remove last ```
+        m = _FENCE_RE.match(raw)
+        if m:
+            raw = m.group(1)
 
-        result = json.loads(raw)
+        result = orjson.loads(raw)
         result["raw_input"] = text
+
+        self._cache.set(key, copy.deepcopy(result))
         return result
 
     def chat(self, messages: list[dict], context: str = "") -> str:
         """Have a conversational exchange with context from the database."""
-        system = CONVERSATION_SYSTEM_PROMPT
+        system = [
+            {"type": "text", "text": CONVERSATION_SYSTEM_PROMPT, "cache_control": CACHE_CONTROL}
+        ]
         if context:
-            system += f"\n\nHere is relevant context from the user's database:\n{context}"
+            system.append({
+                "type": "text",
+                "text": f"Here is relevant context from the user's database:\n{context}",
+            })
 
         response = self.client.messages.create(
             model=self.model,
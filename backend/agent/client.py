@@ -0,0 +1,30 @@
+"""
+Shared Anthropic client configuration for the Cortex agents.
+"""
+
+import httpx
+from anthropic import Anthropic, AsyncAnthropic, DefaultAsyncHttpxClient, DefaultHttpxClient
+
+MODEL = "claude-sonnet-4-20250514"
+# Short, simple inputs are routed here
+FAST_MODEL = "claude-haiku-4-5-20251001"
+
+# Marks a static prompt block (system prompt, tool list) as a prompt-cache
+# breakpoint so Anthropic reuses its prefill across calls
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# One keep-alive pool per flavour, shared by every Anthropic client in the
+# process, so calls reuse warm TLS connections instead of opening their own.
+_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=64)
+_HTTP_CLIENT = DefaultHttpxClient(limits=_LIMITS)
+_ASYNC_HTTP_CLIENT = DefaultAsyncHttpxClient(limits=_LIMITS)
+
+
+def create_client(api_key: str) -> Anthropic:
+    """Anthropic client backed by the shared connection pool."""
+    return Anthropic(api_key=api_key, http_client=_HTTP_CLIENT)
+
+
+def create_async_client(api_key: str) -> AsyncAnthropic:
+    """AsyncAnthropic client backed by the shared async connection pool."""
+    return AsyncAnthropic(api_key=api_key, http_client=_ASYNC_HTTP_CLIENT)
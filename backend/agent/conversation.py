@@ -4,8 +4,14 @@ Uses Claude with tool use for dynamic, context-aware conversations.
 This is the core for the Decagon (conversational) and Greylock (multi-turn agent) prizes.
 """
 
-import json
-from anthropic import Anthropic
+import asyncio
+import hashlib
+
+import orjson
+
+from agent.classifier import is_simple_input
+from agent.client import CACHE_CONTROL, FAST_MODEL, MODEL, create_async_client
+from cache import TTLCache
 
 TOOLS = [
     {
@@ -94,155 +100,278 @@ IMPORTANT BEHAVIORS:
 
 You can chain multiple tool calls to accomplish complex requests."""
 
+CACHED_TOOLS = [*TOOLS[:-1], {**TOOLS[-1], "cache_control": CACHE_CONTROL}]
+
+CACHED_SYSTEM = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": CACHE_CONTROL}]
+
+# Static request parameters shared by every chat call, built once at import
+_CHAT_PARAMS = {
+    "max_tokens": 2048,
+    "system": CACHED_SYSTEM,
+    "tools": CACHED_TOOLS,
+}
+
+# Entry fields the tool handlers put into tool results; storage fetches only these
+SEARCH_FIELDS = ["category", "summary", "title", "raw_input"]
+LIST_FIELDS = ["category", "title", "summary", "created_at"]
+
+# Most recent messages sent verbatim; older turns are replaced by a summary.
+HISTORY_WINDOW = 12
+
+SUMMARY_PROMPT = """Summarize this earlier part of a conversation between a user and their
+personal assistant in a few sentences. Keep facts, decisions, names, dates and anything
+the user asked to remember. Reply with the summary only."""
+
+
+def _content_text(content) -> str:
+    """Flatten message content (a string or a list of blocks) to plain text."""
+    if isinstance(content, str):
+        return content
+    return " ".join(b.get("text", "") for b in content if isinstance(b, dict))
+
 
 class ConversationEngine:
     """Multi-turn conversation engine with tool use for dynamic interactions."""
 
     def __init__(self, api_key: str, classifier=None, storage=None, memory_store=None):
-        self.client = Anthropic(api_key=api_key)
-        self.model = "claude-sonnet-4-20250514"
+        self.client = create_async_client(api_key)
+        self.model = MODEL
+        self.fast_model = FAST_MODEL
         self.classifier = classifier
         self.storage = storage
-        self.memory_store = memory_store  # Fallback in-memory list
+        self.memory_store = memory_store  # Fallback MemoryStore
+        # History prefix digest -> summary. One entry per live conversation (only
+        # the latest cut is stored), so size this for concurrent conversations.
+        self._summaries = TTLCache(maxsize=8192, ttl=3600)
+        self._tool_handlers = {
+            "search_brain": self._search_brain,
+            "dump_entry": self._dump_entry,
+            "get_entries": self._get_entries,
+            "shop_for_product": self._shop_for_product,
+        }
 
-    def _execute_tool(self, tool_name: str, tool_input: dict) -> str:
+    async def _execute_tool(self, tool_name: str, tool_input: dict) -> str:
         """Execute a tool call and return the result as a string."""
+        handler = self._tool_handlers.get(tool_name)
+        if handler is None:
+            return f"Unknown tool: {tool_name}"
+        return await handler(tool_input)
 
-        if tool_name == "search_brain":
-            query = tool_input["query"]
-            categories = tool_input.get("categories")
-            if self.storage:
-                try:
-                    results = self.storage.search(query=query, categories=categories, limit=5)
-                    if results:
-                        parts = []
-                        for r in results:
-                            cat = r.get("category", "unknown")
-                            summary = r.get("summary", r.get("title", "No summary"))
-                            raw = r.get("raw_input", "")[:200]
-                            parts.append(f"[{cat}] {summary}\n  Original: {raw}")
-                        return "\n\n".join(parts)
-                    return "No results found."
-                except Exception as e:
-                    return f"Search error: {e}"
-
-            # Fallback to memory store
-            if self.memory_store is not None:
-                import json as _json
-                query_lower = query.lower()
-                matches = []
-                for entry in self.memory_store:
-                    text = _json.dumps(entry).lower()
-                    if any(word in text for word in query_lower.split()):
-                        matches.append(entry)
-                if matches:
+    # Tool handlers. Blocking classifier/storage calls run in a worker thread
+    # to keep the event loop free.
+
+    async def _search_brain(self, tool_input: dict) -> str:
+        """Search storage (or the memory fallback) for relevant entries."""
+        query = tool_input["query"]
+        categories = tool_input.get("categories")
+        if self.storage:
+            try:
+                results = await asyncio.to_thread(
+                    self.storage.search,
+                    query=query,
+                    categories=categories,
+                    limit=5,
+                    source_includes=SEARCH_FIELDS,
+                )
+                if results:
                     parts = []
-                    for r in matches[:5]:
+                    for r in results:
                         cat = r.get("category", "unknown")
                         summary = r.get("summary", r.get("title", "No summary"))
                         raw = r.get("raw_input", "")[:200]
                         parts.append(f"[{cat}] {summary}\n  Original: {raw}")
                     return "\n\n".join(parts)
-                return "No results found matching your query."
-            return "Database not connected. No results available."
-
-        elif tool_name == "dump_entry":
-            text = tool_input["text"]
-            if self.classifier:
-                try:
-                    entry = self.classifier.classify(text)
-                    if self.storage:
-                        self.storage.store(entry)
-                        return f"Stored as [{entry.get('category')}]: {entry.get('summary', 'Saved')}"
-                    elif self.memory_store is not None:
-                        self.memory_store.append(entry)
-                        return f"Stored as [{entry.get('category')}]: {entry.get('summary', 'Saved')}"
-                    return f"Classified as [{entry.get('category')}]: {entry.get('summary', 'Processed')} (not stored)"
-                except Exception as e:
-                    return f"Failed to process: {e}"
-            return "Classifier not available."
-
-        elif tool_name == "get_entries":
-            category = tool_input.get("category")
-            limit = tool_input.get("limit", 10)
-            if self.storage:
-                try:
-                    entries = self.storage.get_entries(category=category, limit=limit)
-                    if entries:
-                        parts = []
-                        for e in entries:
-                            cat = e.get("category", "unknown")
-                            title = e.get("title", e.get("summary", "Untitled"))
-                            date = e.get("created_at", "")[:10]
-                            parts.append(f"[{cat}] {title} ({date})")
-                        return "\n".join(parts)
-                    return "No entries found."
-                except Exception as e:
-                    return f"Error fetching entries: {e}"
-
-            # Fallback to memory store
-            if self.memory_store is not None:
-                entries = list(self.memory_store)
-                if category:
-                    entries = [e for e in entries if e.get("category") == category]
-                entries = entries[-limit:]
+                return "No results found."
+            except Exception as e:
+                return f"Search error: {e}"
+
+        # Fallback to memory store
+        if self.memory_store is not None:
+            matches = self.memory_store.search(query, limit=5)
+            if matches:
+                parts = []
+                for r in matches:
+                    cat = r.get("category", "unknown")
+                    summary = r.get("summary", r.get("title", "No summary"))
+                    raw = r.get("raw_input", "")[:200]
+                    parts.append(f"[{cat}] {summary}\n  Original: {raw}")
+                return "\n\n".join(parts)
+            return "No results found matching your query."
+        return "Database not connected. No results available."
+
+    async def _dump_entry(self, tool_input: dict) -> str:
+        """Classify text and store it."""
+        text = tool_input["text"]
+        if self.classifier:
+            try:
+                entry = await asyncio.to_thread(self.classifier.classify, text)
+                if self.storage:
+                    await asyncio.to_thread(self.storage.store, entry)
+                    return f"Stored as [{entry.get('category')}]: {entry.get('summary', 'Saved')}"
+                elif self.memory_store is not None:
+                    self.memory_store.append(entry)
+                    return f"Stored as [{entry.get('category')}]: {entry.get('summary', 'Saved')}"
+                return f"Classified as [{entry.get('category')}]: {entry.get('summary', 'Processed')} (not stored)"
+            except Exception as e:
+                return f"Failed to process: {e}"
+        return "Classifier not available."
+
+    async def _get_entries(self, tool_input: dict) -> str:
+        """List recent entries, optionally for one category."""
+        category = tool_input.get("category")
+        limit = tool_input.get("limit", 10)
+        if self.storage:
+            try:
+                entries = await asyncio.to_thread(
+                    self.storage.get_entries,
+                    category=category,
+                    limit=limit,
+                    source_includes=LIST_FIELDS,
+                )
                 if entries:
                     parts = []
                     for e in entries:
                         cat = e.get("category", "unknown")
                         title = e.get("title", e.get("summary", "Untitled"))
-                        parts.append(f"[{cat}] {title}")
+                        date = e.get("created_at", "")[:10]
+                        parts.append(f"[{cat}] {title} ({date})")
                     return "\n".join(parts)
                 return "No entries found."
-            return "Database not connected."
+            except Exception as e:
+                return f"Error fetching entries: {e}"
+
+        # Fallback to memory store
+        if self.memory_store is not None:
+            entries = list(self.memory_store)
+            if category:
+                entries = [e for e in entries if e.get("category") == category]
+            entries = entries[-limit:]
+            if entries:
+                parts = []
+                for e in entries:
+                    cat = e.get("category", "unknown")
+                    title = e.get("title", e.get("summary", "Untitled"))
+                    parts.append(f"[{cat}] {title}")
+                return "\n".join(parts)
+            return "No entries found."
+        return "Database not connected."
+
+    async def _shop_for_product(self, tool_input: dict) -> str:
+        """Acknowledge a product search request."""
+        query = tool_input["query"]
+        return f"Shopping search initiated for: {query}. Check the shopping tab for results."
+
+    async def _summarize(self, older: list[dict]) -> str:
+        """
+        Summarize a history prefix. Starts from the longest prefix already
+        summarized (no model calls to find it) and folds everything after it
+        into that summary with a single request.
+        """
+        # keys[i] identifies older[:i + 1]; each digest chains the previous one
+        keys = []
+        digest = b""
+        for m in older:
+            digest = hashlib.sha256(digest + orjson.dumps(m, option=orjson.OPT_SORT_KEYS)).digest()
+            keys.append(digest)
+
+        prior, done = "", 0
+        for i in range(len(keys) - 1, -1, -1):
+            cached = self._summaries.get(keys[i])
+            if cached is not None:
+                prior, done = cached, i + 1
+                break
+        if done == len(older):
+            return prior
 
-        elif tool_name == "shop_for_product":
-            query = tool_input["query"]
-            return f"Shopping search initiated for: {query}. Check the shopping tab for results."
+        transcript = "\n".join(f"{m['role']}: {_content_text(m['content'])}" for m in older[done:])
+        if prior:
+            transcript = f"Summary so far: {prior}\n\n{transcript}"
 
-        return f"Unknown tool: {tool_name}"
+        response = await self.client.messages.create(
+            model=self.fast_model,
+            max_tokens=400,
+            system=SUMMARY_PROMPT,
+            messages=[{"role": "user", "content": transcript}],
+        )
+        summary = "".join(b.text for b in response.content if hasattr(b, "text"))
+        self._summaries.set(keys[-1], summary)
+        return summary
 
-    def chat(self, messages: list[dict]) -> str:
+    async def _prepare(self, messages: list[dict]) -> tuple[list[dict], dict]:
+        """
+        Bound the history sent to Claude: keep the latest turns verbatim and fold
+        older ones into a summary in the system prompt. The cut point moves in
+        steps of HISTORY_WINDOW so its summary is reused across requests.
+        """
+        cut = (len(messages) - HISTORY_WINDOW) // HISTORY_WINDOW * HISTORY_WINDOW
+        # The kept history has to open with a user turn
+        while 0 < cut < len(messages) and messages[cut].get("role") != "user":
+            cut += 1
+        if cut <= 0 or cut >= len(messages):
+            return list(messages), _CHAT_PARAMS
+
+        try:
+            summary = await self._summarize(messages[:cut])
+        except Exception as e:
+            print(f"History summarization failed, sending full history: {e}")
+            return list(messages), _CHAT_PARAMS
+
+        system = [
+            *CACHED_SYSTEM,
+            {"type": "text", "text": f"Summary of the earlier conversation:\n{summary}"},
+        ]
+        return list(messages[cut:]), {**_CHAT_PARAMS, "system": system}
+
+    def _pick_model(self, messages: list[dict]) -> str:
+        """Route short, plain-text user turns to the faster model."""
+        last = messages[-1] if messages else {}
+        content = last.get("content")
+        if last.get("role") == "user" and isinstance(content, str) and is_simple_input(content):
+            return self.fast_model
+        return self.model
+
+    async def _run_tools(self, content) -> list[dict]:
+        """Execute the tool_use blocks of an assistant turn concurrently and collect the results."""
+        blocks = [block for block in content if block.type == "tool_use"]
+        results = await asyncio.gather(
+            *(self._execute_tool(block.name, block.input) for block in blocks)
+        )
+        return [
+            {
+                "type": "tool_result",
+                "tool_use_id": block.id,
+                "content": result,
+            }
+            for block, result in zip(blocks, results)
+        ]
+
+    async def chat(self, messages: list[dict]) -> str:
         """
         Run a multi-turn conversation with tool use.
         Handles the full agentic loop: user message -> tool calls -> final response.
         """
         # Run the conversation loop
-        current_messages = list(messages)
+        current_messages, params = await self._prepare(messages)
+        model = self._pick_model(messages)
         max_iterations = 5  # Prevent infinite loops
 
         for _ in range(max_iterations):
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=2048,
-                system=SYSTEM_PROMPT,
-                tools=TOOLS,
+            response = await self.client.messages.create(
+                model=model,
                 messages=current_messages,
+                **params,
             )
 
             # Check if we need to execute tools
             if response.stop_reason == "tool_use":
-                # Add assistant response (with tool use blocks)
+                # Add assistant response (with tool use blocks), then the tool results
                 current_messages.append({
                     "role": "assistant",
                     "content": response.content,
                 })
-
-                # Execute each tool call
-                tool_results = []
-                for block in response.content:
-                    if block.type == "tool_use":
-                        result = self._execute_tool(block.name, block.input)
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": block.id,
-                            "content": result,
-                        })
-
-                # Add tool results
                 current_messages.append({
                     "role": "user",
-                    "content": tool_results,
+                    "content": await self._run_tools(response.content),
                 })
             else:
                 # No tool use -- extract text response
@@ -253,3 +382,41 @@ class ConversationEngine:
                 return "\n".join(text_parts) if text_parts else "I'm not sure how to help with that."
 
         return "I've been thinking too hard about this. Could you rephrase?"
+
+    async def chat_stream(self, messages: list[dict]):
+        """
+        Same agentic loop as chat(), but yields text as it is generated so the
+        caller can render the reply from the first token instead of the last.
+        """
+        current_messages, params = await self._prepare(messages)
+        model = self._pick_model(messages)
+        max_iterations = 5  # Prevent infinite loops
+
+        for _ in range(max_iterations):
+            async with self.client.messages.stream(
+                model=model,
+                messages=current_messages,
+                **params,
+            ) as stream:
+                emitted = False
+                async for text in stream.text_stream:
+                    emitted = True
+                    yield text
+                response = await stream.get_final_message()
+
+            if response.stop_reason != "tool_use":
+                return
+
+            # Separate any text before the tool call from what comes after it
+            if emitted:
+                yield "\n"
+            current_messages.append({
+                "role": "assistant",
+                "content": response.content,
+            })
+            current_messages.append({
+                "role": "user",
+                "content": await self._run_tools(response.content),
+            })
+
+        yield "I've been thinking too hard about this. Could you rephrase?"
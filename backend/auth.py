@@ -4,10 +4,19 @@ Resolves API key from request headers to user_id + team_id.
 Used by both the FastAPI backend and MCP server.
 """
 
+import asyncio
+import hashlib
+
 from fastapi import Header, HTTPException
 
+from cache import TTLCache
 from models import get_user_by_api_key, get_user_team_id
 
+# Resolved contexts keyed by a digest of the API key, so repeat requests skip
+# the user and team lookups. Routes that change a user's record or team
+# membership call invalidate_user().
+_AUTH_CACHE = TTLCache(maxsize=10_000, ttl=60)
+
 
 class AuthContext:
     """Holds the resolved user and team for a request."""
@@ -18,43 +27,61 @@ class AuthContext:
         self.user = user
 
 
+def _extract_api_key(authorization: str) -> str:
+    """Accept either "Bearer <key>" or a bare "ctx_..." key."""
+    if authorization[:7] == "Bearer ":
+        return authorization[7:]
+    return authorization if authorization[:4] == "ctx_" else ""
+
+
+def _load(api_key: str) -> AuthContext | None:
+    """Resolve an API key against the database. Blocking; run in a worker thread."""
+    user = get_user_by_api_key(api_key)
+    if not user:
+        return None
+
+    team_id = get_user_team_id(user["id"])
+    return AuthContext(user_id=user["id"], team_id=team_id, user=user)
+
+
+async def _lookup(api_key: str) -> AuthContext | None:
+    """Resolve an API key to an AuthContext, consulting the cache first."""
+    cache_key = hashlib.blake2b(api_key.encode(), digest_size=16).digest()
+    ctx = _AUTH_CACHE.get(cache_key)
+    if ctx is not None:
+        return ctx
+
+    ctx = await asyncio.to_thread(_load, api_key)
+    if ctx is not None:
+        _AUTH_CACHE.set(cache_key, ctx)
+    return ctx
+
+
+def invalidate_user(user_id: str):
+    """Forget cached auth for a user after their record or team membership changes."""
+    _AUTH_CACHE.discard_where(lambda ctx: ctx.user_id == user_id)
+
+
 async def resolve_auth(authorization: str = Header(default="")) -> AuthContext:
     """
     FastAPI dependency that extracts the API key from Authorization header
     and resolves the user + team. Returns AuthContext.
     Non-authenticated requests get a None context (for public endpoints).
     """
-    api_key = ""
-    if authorization.startswith("Bearer "):
-        api_key = authorization[7:]
-    elif authorization.startswith("ctx_"):
-        api_key = authorization
-
+    api_key = _extract_api_key(authorization)
     if not api_key:
         raise HTTPException(status_code=401, detail="Missing API key. Set Authorization: Bearer <api_key>")
 
-    user = get_user_by_api_key(api_key)
-    if not user:
+    ctx = await _lookup(api_key)
+    if not ctx:
         raise HTTPException(status_code=401, detail="Invalid API key")
-
-    team_id = get_user_team_id(user["id"])
-    return AuthContext(user_id=user["id"], team_id=team_id, user=user)
+    return ctx
 
 
 async def optional_auth(authorization: str = Header(default="")) -> AuthContext | None:
     """Same as resolve_auth but returns None instead of raising on missing key."""
-    api_key = ""
-    if authorization.startswith("Bearer "):
-        api_key = authorization[7:]
-    elif authorization.startswith("ctx_"):
-        api_key = authorization
-
+    api_key = _extract_api_key(authorization)
     if not api_key:
         return None
 
-    user = get_user_by_api_key(api_key)
-    if not user:
-        return None
-
-    team_id = get_user_team_id(user["id"])
-    return AuthContext(user_id=user["id"], team_id=team_id, user=user)
+    return await _lookup(api_key)
@@ -3,19 +3,20 @@ Calendar free-slot computation.
 Merges busy intervals from all team members and finds overlapping free windows.
 """
 
+from bisect import bisect_right
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 
+@lru_cache(maxsize=4096)
 def _parse_dt(s: str) -> datetime:
-    """Parse an ISO datetime string."""
-    # Handle multiple formats
-    for fmt in ("%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M"):
-        try:
-            return datetime.fromisoformat(s)
-        except ValueError:
-            continue
-    # Last resort: just a date
-    return datetime.strptime(s, "%Y-%m-%d")
+    """Parse an ISO datetime string.
+    Cached: the same event boundaries recur across members and requests."""
+    try:
+        return datetime.fromisoformat(s)
+    except ValueError:
+        # Last resort: just a date
+        return datetime.strptime(s, "%Y-%m-%d")
 
 
 def _format_dt(dt: datetime) -> str:
@@ -31,13 +32,19 @@ def merge_intervals(intervals: list[tuple[datetime, datetime]]) -> list[tuple[da
     """Merge overlapping time intervals into non-overlapping ones."""
     if not intervals:
         return []
-    sorted_ivs = sorted(intervals, key=lambda x: x[0])
-    merged = [sorted_ivs[0]]
-    for start, end in sorted_ivs[1:]:
-        if start <= merged[-1][1]:
-            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+    # Native tuple ordering (start, then end) avoids a key call per item, and the
+    # open interval lives in locals instead of being rebuilt in the list.
+    it = iter(sorted(intervals))
+    cur_start, cur_end = next(it)
+    merged = []
+    for start, end in it:
+        if start <= cur_end:
+            if end > cur_end:
+                cur_end = end
         else:
-            merged.append((start, end))
+            merged.append((cur_start, cur_end))
+            cur_start, cur_end = start, end
+    merged.append((cur_start, cur_end))
     return merged
 
 
@@ -46,20 +53,19 @@ def subtract_intervals(
     busy: list[tuple[datetime, datetime]],
 ) -> list[tuple[datetime, datetime]]:
     """Subtract busy intervals from free intervals."""
+    # Merged intervals are sorted and disjoint, so their ends are sorted too and
+    # each free window can binary-search to the first busy block that matters.
+    merged = merge_intervals(busy)
+    busy_ends = [end for _, end in merged]
     result = []
-    busy_idx = 0
-    busy_sorted = sorted(busy, key=lambda x: x[0])
 
     for f_start, f_end in free:
         current = f_start
-        while busy_idx < len(busy_sorted) and busy_sorted[busy_idx][1] <= current:
-            busy_idx += 1
-
-        bi = busy_idx
-        while bi < len(busy_sorted) and busy_sorted[bi][0] < f_end:
-            b_start, b_end = busy_sorted[bi]
+        bi = bisect_right(busy_ends, current)
+        while bi < len(merged) and merged[bi][0] < f_end:
+            b_start, b_end = merged[bi]
             if b_start > current:
-                result.append((current, min(b_start, f_end)))
+                result.append((current, b_start))
             current = max(current, b_end)
             bi += 1
 
@@ -103,27 +109,34 @@ def find_free_slots(
     except ValueError:
         range_end = _parse_dt(end_date)
 
-    # Build per-day free windows (business hours)
+    # Build per-day free windows (business hours), Mon-Fri only: start on the
+    # first weekday and step straight from Friday to Monday.
     free_windows: list[tuple[datetime, datetime]] = []
     current_day = range_start
+    if current_day.weekday() >= 5:
+        current_day += timedelta(days=7 - current_day.weekday())
     while current_day <= range_end:
         day_start = current_day.replace(hour=day_start_hour, minute=0, second=0)
         day_end = current_day.replace(hour=day_end_hour, minute=0, second=0)
-        # Skip weekends
-        if current_day.weekday() < 5:  # Mon-Fri
-            free_windows.append((day_start, day_end))
-        current_day += timedelta(days=1)
+        free_windows.append((day_start, day_end))
+        current_day += timedelta(days=3 if current_day.weekday() == 4 else 1)
 
     if not free_windows:
         return []
 
-    # Merge ALL busy intervals from ALL members
+    # Merge ALL busy intervals from ALL members. A shared meeting shows up on
+    # every attendee's list, so each distinct interval is parsed only once.
     all_busy: list[tuple[datetime, datetime]] = []
+    seen: set[tuple[str, str]] = set()
     for member_busy in all_busy_times:
         for interval in member_busy:
             try:
-                start = _parse_dt(interval["start"])
-                end = _parse_dt(interval["end"])
+                key = (interval["start"], interval["end"])
+                if key in seen:
+                    continue
+                seen.add(key)
+                start = _parse_dt(key[0])
+                end = _parse_dt(key[1])
                 # Strip timezone for comparison if needed
                 if start.tzinfo:
                     start = start.replace(tzinfo=None)
@@ -134,10 +147,8 @@ def find_free_slots(
                 print(f"Skipping invalid interval {interval}: {e}")
                 continue
 
-    merged_busy = merge_intervals(all_busy)
-
-    # Subtract busy from free
-    available = subtract_intervals(free_windows, merged_busy)
+    # Subtract busy from free (merges the busy intervals first)
+    available = subtract_intervals(free_windows, all_busy)
 
     # Filter by minimum duration
     min_duration = timedelta(minutes=duration_minutes)
@@ -3,35 +3,53 @@ Cortex Backend - FastAPI server
 The brain behind the universal AI inbox.
 """
 
+import asyncio
 import os
-import json
 from contextlib import asynccontextmanager
 
 import httpx
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 load_dotenv()
 
 from agent.classifier import CortexClassifier
 from agent.conversation import ConversationEngine
-from models import init_db as init_sqlite
+from models import init_db as init_sqlite, purge_expired_sync_tokens
+from poke_relay import close_poke_client
 from routes.teams import router as teams_router
 from storage.elasticsearch import CortexStorage
+from storage.memory import MemoryStore
 
 # ── Global instances ──────────────────────────────────────────────────────────
 
 classifier: CortexClassifier | None = None
 conversation_engine: ConversationEngine | None = None
 storage: CortexStorage | None = None
+shop_client: httpx.AsyncClient | None = None
 
 # ── Lifespan ──────────────────────────────────────────────────────────────────
 
+SYNC_TOKEN_SWEEP_INTERVAL = 60  # seconds
+SYNC_TOKEN_MAX_AGE = 3600  # seconds; unused tokens older than this are dropped
+
+
+async def sweep_sync_tokens():
+    """Periodically delete abandoned calendar sync tokens."""
+    while True:
+        await asyncio.sleep(SYNC_TOKEN_SWEEP_INTERVAL)
+        try:
+            await asyncio.to_thread(purge_expired_sync_tokens, SYNC_TOKEN_MAX_AGE)
+        except Exception as e:
+            print(f"Sync token sweep failed: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global classifier, conversation_engine, storage
+    global classifier, conversation_engine, storage, shop_client
 
     # Initialize SQLite for teams, users, availability
     init_sqlite()
@@ -67,14 +85,29 @@ async def lifespan(app: FastAPI):
     )
     print("Conversation engine initialized.")
 
+    # Pooled client for the shopping agent. The short connect timeout makes
+    # /shop fail fast when the agent isn't running.
+    shop_client = httpx.AsyncClient(
+        base_url=os.getenv("SHOPPING_AGENT_URL", "http://localhost:8002"),
+        timeout=httpx.Timeout(60.0, connect=1.0),
+        limits=httpx.Limits(max_keepalive_connections=8, max_connections=32),
+    )
+
+    sweeper = asyncio.create_task(sweep_sync_tokens())
+
     yield
 
+    sweeper.cancel()
+    await shop_client.aclose()
+    await close_poke_client()
+
 # ── App ───────────────────────────────────────────────────────────────────────
 
 app = FastAPI(
     title="Cortex API",
     description="Universal AI Inbox - dump anything, get structure back",
     version="0.1.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan,
 )
 
@@ -91,7 +124,7 @@ app.include_router(teams_router)
 
 # ── In-memory fallback store ─────────────────────────────────────────────────
 
-memory_store: list[dict] = []
+memory_store = MemoryStore()
 
 # ── Request/Response Models ───────────────────────────────────────────────────
 
@@ -136,7 +169,7 @@ async def dump(req: DumpRequest):
 
     try:
         # Step 1: Classify the input
-        entry = classifier.classify(req.text)
+        entry = await asyncio.to_thread(classifier.classify, req.text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Classification failed: {str(e)}")
 
@@ -144,7 +177,7 @@ async def dump(req: DumpRequest):
     storage_result = None
     if storage:
         try:
-            storage_result = storage.store(entry)
+            storage_result = await asyncio.to_thread(storage.store, entry)
         except Exception as e:
             print(f"Storage error: {e}")
             # Fall back to memory
@@ -154,7 +187,9 @@ async def dump(req: DumpRequest):
         memory_store.append(entry)
         storage_result = {"fallback": "memory", "index": len(memory_store) - 1}
 
-    return DumpResponse(success=True, entry=entry, storage=storage_result)
+    # Plain dict: FastAPI validates it against response_model once, instead of
+    # dumping a model instance and then validating the dump again
+    return {"success": True, "entry": entry, "storage": storage_result}
 
 
 @app.post("/query")
@@ -162,7 +197,8 @@ async def query(req: QueryRequest):
     """Semantic search across the user's personal database."""
     if storage:
         try:
-            results = storage.search(
+            results = await asyncio.to_thread(
+                storage.search,
                 query=req.query,
                 categories=req.categories,
                 limit=req.limit,
@@ -172,13 +208,8 @@ async def query(req: QueryRequest):
             print(f"Search error: {e}")
 
     # Fallback to memory store search
-    results = []
-    query_lower = req.query.lower()
-    for entry in memory_store:
-        text = json.dumps(entry).lower()
-        if query_lower in text:
-            results.append(entry)
-    return {"results": results[:req.limit], "count": len(results[:req.limit])}
+    results = memory_store.find(req.query, limit=req.limit)
+    return {"results": results, "count": len(results)}
 
 
 @app.get("/entries")
@@ -186,7 +217,7 @@ async def get_entries(category: str | None = None, limit: int = 50):
     """Get recent entries, optionally filtered by category."""
     if storage:
         try:
-            results = storage.get_entries(category=category, limit=limit)
+            results = await asyncio.to_thread(storage.get_entries, category=category, limit=limit)
             return {"entries": results, "count": len(results)}
         except Exception as e:
             print(f"Entries error: {e}")
@@ -211,11 +242,44 @@ async def chat_endpoint(req: ChatRequest):
         raise HTTPException(status_code=503, detail="Conversation engine not initialized")
 
     try:
-        response_text = conversation_engine.chat(req.messages)
-        return ChatResponse(response=response_text)
+        response_text = await conversation_engine.chat(req.messages)
+        return {"response": response_text}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest):
+    """
+    Streaming variant of /chat. Returns the assistant's reply as plain-text
+    chunks as they are generated, so the UI can render before the turn ends.
+    """
+    if not conversation_engine:
+        raise HTTPException(status_code=503, detail="Conversation engine not initialized")
+
+    stream = conversation_engine.chat_stream(req.messages)
+    # Pull the first chunk before responding: once StreamingResponse starts,
+    # the 200 is already sent, so early failures have to surface here.
+    try:
+        first = await anext(stream)
+    except StopAsyncIteration:
+        first = ""
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
+    async def body():
+        try:
+            yield first
+            async for chunk in stream:
+                yield chunk
+        except Exception as e:
+            print(f"Chat stream failed: {e}")
+            yield f"\n[Chat failed: {str(e)}]"
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(body(), media_type="text/plain")
+
 
 # ── Shopping Proxy ────────────────────────────────────────────────────────────
 
@@ -228,37 +292,31 @@ async def shop(req: ShopRequest):
     Trigger Stagehand-powered shopping automation.
     Proxies to the Node.js shopping agent service.
     """
-    shopping_url = os.getenv("SHOPPING_AGENT_URL", "http://localhost:8002")
-
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            resp = await client.post(
-                f"{shopping_url}/shop",
-                json={"query": req.query},
-            )
-            resp.raise_for_status()
-            result = resp.json()
-
-            # Store the shopping results
-            if storage:
-                try:
-                    storage.store({
-                        "category": "shopping",
-                        "product": req.query,
-                        "summary": result.get("comparison", ""),
-                        "results": result.get("results", []),
-                        "raw_input": f"Shopping search: {req.query}",
-                        "tags": ["shopping", "automated"],
-                    })
-                except Exception as e:
-                    print(f"Failed to store shopping results: {e}")
-
-            return result
-    except httpx.ConnectError:
+        resp = await shop_client.post("/shop", json={"query": req.query})
+        resp.raise_for_status()
+        result = resp.json()
+
+        # Store the shopping results
+        if storage:
+            try:
+                await asyncio.to_thread(storage.store, {
+                    "category": "shopping",
+                    "product": req.query,
+                    "summary": result.get("comparison", ""),
+                    "results": result.get("results", []),
+                    "raw_input": f"Shopping search: {req.query}",
+                    "tags": ["shopping", "automated"],
+                })
+            except Exception as e:
+                print(f"Failed to store shopping results: {e}")
+
+        return result
+    except (httpx.ConnectError, httpx.ConnectTimeout):
         # Shopping agent not running - still record the intent
         if storage:
             try:
-                storage.store({
+                await asyncio.to_thread(storage.store, {
                     "category": "shopping",
                     "product": req.query,
                     "summary": f"Shopping intent: {req.query}",
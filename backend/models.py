@@ -3,23 +3,44 @@ SQLite models for Multiplayer Poke.
 Manages users, teams, team membership, and calendar availability cache.
 """
 
-import json
 import os
 import secrets
 import sqlite3
+import threading
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+import orjson
+
+from cache import TTLCache
+
 DB_PATH = os.getenv("CORTEX_DB_PATH", str(Path(__file__).parent / "cortex.db"))
 
+# Teams are never updated after creation, so lookups by id or invite code can
+# be served from memory. Misses aren't cached; a team created in another
+# process is picked up on the next lookup.
+_TEAM_BY_ID = TTLCache(maxsize=10_000, ttl=600)
+_TEAM_BY_CODE = TTLCache(maxsize=10_000, ttl=600)
+
 # ── Connection helper ─────────────────────────────────────────────────────────
 
+# One long-lived connection per thread: opening a connection and applying the
+# PRAGMAs costs more than most of the queries below.
+_local = threading.local()
+
+
 def _get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA foreign_keys=ON")
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL only fsyncs at checkpoints, which is still crash-safe in WAL mode
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA wal_autocheckpoint=1000")
+        conn.execute("PRAGMA foreign_keys=ON")
+        _local.conn = conn
     return conn
 
 
@@ -55,6 +76,8 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users(id)
         );
 
+        CREATE INDEX IF NOT EXISTS idx_tm_user ON team_members(user_id);
+
         CREATE TABLE IF NOT EXISTS availability_cache (
             id         INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id    TEXT NOT NULL,
@@ -65,7 +88,13 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users(id)
         );
 
-        CREATE INDEX IF NOT EXISTS idx_availability_user
+        -- One row per (user, range); older databases may hold duplicates from
+        -- before the unique index, so keep only the newest before creating it.
+        DROP INDEX IF EXISTS idx_availability_user;
+        DELETE FROM availability_cache WHERE id NOT IN (
+            SELECT MAX(id) FROM availability_cache GROUP BY user_id, date_start, date_end
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_availability_range
             ON availability_cache(user_id, date_start, date_end);
 
         CREATE TABLE IF NOT EXISTS sync_tokens (
@@ -77,9 +106,10 @@ def init_db():
             created_at  TEXT NOT NULL,
             FOREIGN KEY (user_id) REFERENCES users(id)
         );
+
+        CREATE INDEX IF NOT EXISTS idx_sync_created ON sync_tokens(created_at);
     """)
     conn.commit()
-    conn.close()
     print(f"SQLite database initialized at {DB_PATH}")
 
 
@@ -90,37 +120,38 @@ def create_user(name: str, email: str = "", poke_api_key: str = "") -> dict:
     user_id = str(uuid.uuid4())
     api_key = f"ctx_{secrets.token_hex(20)}"
     now = datetime.now(timezone.utc).isoformat()
-    conn.execute(
-        "INSERT INTO users (id, name, email, poke_api_key, api_key, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-        (user_id, name, email, poke_api_key, api_key, now),
-    )
-    conn.commit()
-    user = dict(conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone())
-    conn.close()
-    return user
+    with conn:
+        conn.execute(
+            "INSERT INTO users (id, name, email, poke_api_key, api_key, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, name, email, poke_api_key, api_key, now),
+        )
+    return {
+        "id": user_id,
+        "name": name,
+        "email": email,
+        "poke_api_key": poke_api_key,
+        "api_key": api_key,
+        "created_at": now,
+    }
 
 
 def get_user_by_api_key(api_key: str) -> dict | None:
     conn = _get_conn()
     row = conn.execute("SELECT * FROM users WHERE api_key = ?", (api_key,)).fetchone()
-    conn.close()
     return dict(row) if row else None
 
 
 def get_user_by_id(user_id: str) -> dict | None:
     conn = _get_conn()
     row = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
-    conn.close()
     return dict(row) if row else None
 
 
 def update_user_poke_key(user_id: str, poke_api_key: str) -> bool:
     conn = _get_conn()
-    conn.execute("UPDATE users SET poke_api_key = ? WHERE id = ?", (poke_api_key, user_id))
-    conn.commit()
-    changed = conn.total_changes > 0
-    conn.close()
-    return changed
+    with conn:
+        cur = conn.execute("UPDATE users SET poke_api_key = ? WHERE id = ?", (poke_api_key, user_id))
+    return cur.rowcount > 0
 
 
 # ── Team CRUD ─────────────────────────────────────────────────────────────────
@@ -130,48 +161,68 @@ def create_team(name: str, created_by: str) -> dict:
     team_id = str(uuid.uuid4())
     invite_code = secrets.token_hex(4).upper()  # 8-char hex code
     now = datetime.now(timezone.utc).isoformat()
-    conn.execute(
-        "INSERT INTO teams (id, name, invite_code, created_by, created_at) VALUES (?, ?, ?, ?, ?)",
-        (team_id, name, invite_code, created_by, now),
-    )
-    # Creator auto-joins as admin
-    conn.execute(
-        "INSERT INTO team_members (team_id, user_id, role, joined_at) VALUES (?, ?, 'admin', ?)",
-        (team_id, created_by, now),
-    )
-    conn.commit()
-    team = dict(conn.execute("SELECT * FROM teams WHERE id = ?", (team_id,)).fetchone())
-    conn.close()
-    return team
+    with conn:
+        conn.execute(
+            "INSERT INTO teams (id, name, invite_code, created_by, created_at) VALUES (?, ?, ?, ?, ?)",
+            (team_id, name, invite_code, created_by, now),
+        )
+        # Creator auto-joins as admin
+        conn.execute(
+            "INSERT INTO team_members (team_id, user_id, role, joined_at) VALUES (?, ?, 'admin', ?)",
+            (team_id, created_by, now),
+        )
+    team = {
+        "id": team_id,
+        "name": name,
+        "invite_code": invite_code,
+        "created_by": created_by,
+        "created_at": now,
+    }
+    _cache_team(team)
+    return dict(team)
+
+
+def _cache_team(team: dict):
+    _TEAM_BY_ID.set(team["id"], team)
+    _TEAM_BY_CODE.set(team["invite_code"], team)
 
 
 def get_team_by_id(team_id: str) -> dict | None:
-    conn = _get_conn()
-    row = conn.execute("SELECT * FROM teams WHERE id = ?", (team_id,)).fetchone()
-    conn.close()
-    return dict(row) if row else None
+    team = _TEAM_BY_ID.get(team_id)
+    if team is None:
+        conn = _get_conn()
+        row = conn.execute("SELECT * FROM teams WHERE id = ?", (team_id,)).fetchone()
+        if not row:
+            return None
+        team = dict(row)
+        _cache_team(team)
+    return dict(team)
 
 
 def get_team_by_invite_code(code: str) -> dict | None:
-    conn = _get_conn()
-    row = conn.execute("SELECT * FROM teams WHERE invite_code = ?", (code.upper(),)).fetchone()
-    conn.close()
-    return dict(row) if row else None
+    code = code.upper()
+    team = _TEAM_BY_CODE.get(code)
+    if team is None:
+        conn = _get_conn()
+        row = conn.execute("SELECT * FROM teams WHERE invite_code = ?", (code,)).fetchone()
+        if not row:
+            return None
+        team = dict(row)
+        _cache_team(team)
+    return dict(team)
 
 
 def join_team(team_id: str, user_id: str, role: str = "member") -> bool:
     conn = _get_conn()
     now = datetime.now(timezone.utc).isoformat()
     try:
-        conn.execute(
-            "INSERT OR IGNORE INTO team_members (team_id, user_id, role, joined_at) VALUES (?, ?, ?, ?)",
-            (team_id, user_id, role, now),
-        )
-        conn.commit()
-        conn.close()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO team_members (team_id, user_id, role, joined_at) VALUES (?, ?, ?, ?)",
+                (team_id, user_id, role, now),
+            )
         return True
     except Exception:
-        conn.close()
         return False
 
 
@@ -183,10 +234,22 @@ def get_team_members(team_id: str) -> list[dict]:
         JOIN users u ON tm.user_id = u.id
         WHERE tm.team_id = ?
     """, (team_id,)).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 
+def get_team_roster(team_id: str) -> list[dict]:
+    """Team members without credentials; poke_connected says whether a Poke key is set."""
+    conn = _get_conn()
+    rows = conn.execute("""
+        SELECT u.id, u.name, u.email, tm.role, tm.joined_at,
+               COALESCE(u.poke_api_key, '') != '' AS poke_connected
+        FROM team_members tm
+        JOIN users u ON tm.user_id = u.id
+        WHERE tm.team_id = ?
+    """, (team_id,)).fetchall()
+    return [{**r, "poke_connected": bool(r["poke_connected"])} for r in map(dict, rows)]
+
+
 def get_user_teams(user_id: str) -> list[dict]:
     conn = _get_conn()
     rows = conn.execute("""
@@ -195,7 +258,6 @@ def get_user_teams(user_id: str) -> list[dict]:
         JOIN teams t ON tm.team_id = t.id
         WHERE tm.user_id = ?
     """, (user_id,)).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 
@@ -211,17 +273,16 @@ def store_availability(user_id: str, date_start: str, date_end: str, busy_times:
     """Store or update a user's availability for a date range."""
     conn = _get_conn()
     now = datetime.now(timezone.utc).isoformat()
-    # Upsert: delete old entry for same range, insert new
-    conn.execute(
-        "DELETE FROM availability_cache WHERE user_id = ? AND date_start = ? AND date_end = ?",
-        (user_id, date_start, date_end),
-    )
-    conn.execute(
-        "INSERT INTO availability_cache (user_id, date_start, date_end, busy_times, synced_at) VALUES (?, ?, ?, ?, ?)",
-        (user_id, date_start, date_end, json.dumps(busy_times), now),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO availability_cache (user_id, date_start, date_end, busy_times, synced_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, date_start, date_end)
+                DO UPDATE SET busy_times = excluded.busy_times, synced_at = excluded.synced_at
+            """,
+            (user_id, date_start, date_end, orjson.dumps(busy_times).decode(), now),
+        )
 
 
 def get_availability(user_id: str, date_start: str, date_end: str) -> dict | None:
@@ -231,50 +292,65 @@ def get_availability(user_id: str, date_start: str, date_end: str) -> dict | Non
         "SELECT * FROM availability_cache WHERE user_id = ? AND date_start = ? AND date_end = ?",
         (user_id, date_start, date_end),
     ).fetchone()
-    conn.close()
     if row:
         d = dict(row)
-        d["busy_times"] = json.loads(d["busy_times"])
+        d["busy_times"] = orjson.loads(d["busy_times"])
         return d
     return None
 
 
 def get_team_availability(team_id: str, date_start: str, date_end: str) -> dict[str, list[dict]]:
-    """Get cached availability for all members of a team."""
-    members = get_team_members(team_id)
-    result: dict[str, list[dict]] = {}
-    for m in members:
-        avail = get_availability(m["id"], date_start, date_end)
-        if avail:
-            result[m["id"]] = avail["busy_times"]
-    return result
+    """Get cached availability for all members of a team (one query, not one per member)."""
+    conn = _get_conn()
+    rows = conn.execute("""
+        SELECT tm.user_id, ac.busy_times
+        FROM team_members tm
+        JOIN availability_cache ac
+            ON ac.user_id = tm.user_id AND ac.date_start = ? AND ac.date_end = ?
+        WHERE tm.team_id = ?
+    """, (date_start, date_end, team_id)).fetchall()
+    return {r["user_id"]: orjson.loads(r["busy_times"]) for r in rows}
 
 
 # ── Sync Tokens (for Poke relay calendar sync) ────────────────────────────────
 
 def create_sync_token(user_id: str, team_id: str, date_start: str, date_end: str) -> str:
     """Create a one-time sync token for a user to report calendar availability."""
-    token = secrets.token_hex(12)
+    return create_sync_tokens([user_id], team_id, date_start, date_end)[user_id]
+
+
+def create_sync_tokens(user_ids: list[str], team_id: str, date_start: str, date_end: str) -> dict[str, str]:
+    """Create sync tokens for several users in one transaction. Returns {user_id: token}."""
+    # One getrandom call for the whole batch, sliced into 12-byte tokens
+    entropy = os.urandom(12 * len(user_ids))
+    tokens = {uid: entropy[i * 12:(i + 1) * 12].hex() for i, uid in enumerate(user_ids)}
     now = datetime.now(timezone.utc).isoformat()
     conn = _get_conn()
-    conn.execute(
-        "INSERT INTO sync_tokens (token, user_id, team_id, date_start, date_end, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-        (token, user_id, team_id, date_start, date_end, now),
-    )
-    conn.commit()
-    conn.close()
-    return token
+    with conn:
+        conn.executemany(
+            "INSERT INTO sync_tokens (token, user_id, team_id, date_start, date_end, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(token, uid, team_id, date_start, date_end, now) for uid, token in tokens.items()],
+        )
+    return tokens
 
 
 def consume_sync_token(token: str) -> dict | None:
     """Consume a sync token and return user_id, team_id, date_start, date_end. Deletes token."""
     conn = _get_conn()
-    row = conn.execute("SELECT * FROM sync_tokens WHERE token = ?", (token,)).fetchone()
-    if not row:
-        conn.close()
-        return None
-    result = dict(row)
-    conn.execute("DELETE FROM sync_tokens WHERE token = ?", (token,))
-    conn.commit()
-    conn.close()
-    return result
+    with conn:
+        row = conn.execute("SELECT * FROM sync_tokens WHERE token = ?", (token,)).fetchone()
+        if not row:
+            return None
+        conn.execute("DELETE FROM sync_tokens WHERE token = ?", (token,))
+    return dict(row)
+
+
+def purge_expired_sync_tokens(max_age_seconds: int = 3600) -> int:
+    """Delete sync tokens older than max_age_seconds. Returns how many were removed."""
+    # Compare against a Python isoformat cutoff: created_at uses that format,
+    # which doesn't sort consistently against SQLite's datetime('now')
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)).isoformat()
+    conn = _get_conn()
+    with conn:
+        cur = conn.execute("DELETE FROM sync_tokens WHERE created_at < ?", (cutoff,))
+    return cur.rowcount
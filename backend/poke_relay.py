@@ -13,10 +13,48 @@ from models import (
     get_availability,
     get_team_availability,
     create_sync_token,
+    create_sync_tokens,
 )
 from calendar_logic import find_free_slots
 
-POKE_API_URL = "https://poke.com/api/v1/inbound-sms/webhook"
+POKE_BASE_URL = "https://poke.com"
+POKE_WEBHOOK_PATH = "/api/v1/inbound-sms/webhook"
+MAX_CONCURRENT_SENDS = 32
+
+# One pooled client for all relay traffic, so fan-outs to many members reuse
+# keep-alive connections instead of paying a TCP+TLS handshake per message.
+_client: httpx.AsyncClient | None = None
+
+
+def get_poke_client() -> httpx.AsyncClient:
+    """Return the shared Poke HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=POKE_BASE_URL,
+            timeout=httpx.Timeout(15.0, connect=1.0),
+            limits=httpx.Limits(max_keepalive_connections=100, max_connections=1024),
+        )
+    return _client
+
+
+# Events of request_team_availability calls currently waiting on each team.
+# A calendar sync report sets them so the waiter re-checks immediately.
+_availability_waiters: dict[str, set[asyncio.Event]] = {}
+
+
+def notify_availability(team_id: str):
+    """Wake any request_team_availability calls waiting on this team's reports."""
+    for event in _availability_waiters.get(team_id, ()):
+        event.set()
+
+
+async def close_poke_client():
+    """Close the shared Poke client (called on app shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
 
 
 async def send_poke_message(poke_api_key: str, message: str) -> dict:
@@ -24,17 +62,16 @@ async def send_poke_message(poke_api_key: str, message: str) -> dict:
     Send a message to a user's Poke via the inbound SMS webhook.
     This sends the message AS the user to their Poke assistant.
     """
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        resp = await client.post(
-            POKE_API_URL,
-            headers={
-                "Authorization": f"Bearer {poke_api_key}",
-                "Content-Type": "application/json",
-            },
-            json={"message": message},
-        )
-        resp.raise_for_status()
-        return resp.json()
+    resp = await get_poke_client().post(
+        POKE_WEBHOOK_PATH,
+        headers={
+            "Authorization": f"Bearer {poke_api_key}",
+            "Content-Type": "application/json",
+        },
+        json={"message": message},
+    )
+    resp.raise_for_status()
+    return resp.json()
 
 
 async def request_calendar_sync(
@@ -44,13 +81,16 @@ async def request_calendar_sync(
     start_date: str,
     end_date: str,
     integration_name: str = "Team Brain",
+    token: str | None = None,
 ) -> bool:
     """
     Ask a team member's Poke to check their calendar and report
     availability via our MCP sync_my_calendar tool.
-    Uses a one-time sync token for secure user identification.
+    Uses a one-time sync token for secure user identification; pass a
+    pre-issued token to skip creating one here.
     """
-    token = create_sync_token(user_id, team_id, start_date, end_date)
+    if token is None:
+        token = await asyncio.to_thread(create_sync_token, user_id, team_id, start_date, end_date)
     message = (
         f"Check my calendar from {start_date} to {end_date} "
         f'and use the "{integration_name}" integration\'s sync_my_calendar tool '
@@ -79,7 +119,7 @@ async def request_team_availability(
     2. Poll for availability reports
     3. Compute free slots
     """
-    members = get_team_members(team_id)
+    members = await asyncio.to_thread(get_team_members, team_id)
     if not members:
         return {"success": False, "message": "No team members found.", "slots": []}
 
@@ -87,51 +127,72 @@ async def request_team_availability(
     member_names = {m["id"]: m["name"] for m in members}
 
     # Step 1: Send relay messages to all members (except requester)
-    relay_tasks = []
+    recipients = []
     for member in members:
         if member["id"] == requesting_user_id:
             continue  # Requesting user's Poke is already handling this
-        poke_key = member.get("poke_api_key", "")
-        if not poke_key:
+        if not member.get("poke_api_key", ""):
             print(f"Member {member['name']} has no Poke API key, skipping relay")
             continue
-        relay_tasks.append(
-            request_calendar_sync(poke_key, member["id"], team_id, start_date, end_date)
-        )
+        recipients.append(member)
 
-    if relay_tasks:
-        await asyncio.gather(*relay_tasks, return_exceptions=True)
+    if recipients:
+        tokens = await asyncio.to_thread(
+            create_sync_tokens, [m["id"] for m in recipients], team_id, start_date, end_date
+        )
+        await asyncio.gather(
+            *(
+                request_calendar_sync(
+                    m["poke_api_key"], m["id"], team_id, start_date, end_date, token=tokens[m["id"]]
+                )
+                for m in recipients
+            ),
+            return_exceptions=True,
+        )
 
-    # Step 2: Poll for availability (wait for sync_my_calendar callbacks)
+    # Step 2: Wait for availability (sync_my_calendar callbacks wake us via
+    # notify_availability; the backoff poll is a safety net for reports that
+    # land in another worker process)
+    event = asyncio.Event()
+    waiters = _availability_waiters.setdefault(team_id, set())
+    waiters.add(event)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
     poll_interval = 2.0
-    elapsed = 0.0
-
-    while elapsed < timeout:
-        await asyncio.sleep(poll_interval)
-        elapsed += poll_interval
+    team_avail = None
 
-        # Check how many members have reported
-        team_avail = get_team_availability(team_id, start_date, end_date)
-        reported_count = len(team_avail)
-
-        if reported_count >= len(member_ids):
-            break  # All members reported
+    try:
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                await asyncio.wait_for(event.wait(), min(poll_interval, remaining))
+            except asyncio.TimeoutError:
+                # Exponential backoff (cap at 5s)
+                poll_interval = min(poll_interval * 1.3, 5.0)
+            event.clear()
 
-        # Exponential backoff (cap at 5s)
-        poll_interval = min(poll_interval * 1.3, 5.0)
+            # Check how many members have reported
+            team_avail = await asyncio.to_thread(get_team_availability, team_id, start_date, end_date)
+            reported_count = len(team_avail)
 
-    # Step 3: Compute free slots with whatever data we have
-    team_avail = get_team_availability(team_id, start_date, end_date)
-    reported_names = [
-        member_names.get(uid, "Unknown") for uid in team_avail.keys()
-    ]
-    missing_names = [
-        member_names[uid]
-        for uid in member_ids
-        if uid not in team_avail
-    ]
+            if reported_count >= len(member_ids):
+                break  # All members reported
+    finally:
+        waiters.discard(event)
+        if not waiters:
+            _availability_waiters.pop(team_id, None)
 
-    all_busy = list(team_avail.values())
+    # Step 3: Compute free slots with whatever data we have. Every loop pass
+    # ends with a fresh read, so only query again if the loop never ran.
+    if team_avail is None:
+        team_avail = await asyncio.to_thread(get_team_availability, team_id, start_date, end_date)
+    reported_names, missing_names, all_busy = [], [], []
+    for uid in member_ids:
+        busy = team_avail.get(uid)
+        if busy is None:
+            missing_names.append(member_names[uid])
+        else:
+            reported_names.append(member_names[uid])
+            all_busy.append(busy)
 
     if not all_busy:
         return {
@@ -175,7 +236,7 @@ async def send_booking_to_team(
     Send a calendar booking message to all team members' Pokes.
     Each member's Poke will create the calendar event via its native integration.
     """
-    members = get_team_members(team_id)
+    members = await asyncio.to_thread(get_team_members, team_id)
     booked_by_name = next((m["name"] for m in members if m["id"] == booked_by), "Someone")
 
     message = (
@@ -183,17 +244,21 @@ async def send_booking_to_team(
         f"for {duration_minutes} minutes. This was booked by {booked_by_name} for the team."
     )
 
-    results = []
-    for member in members:
+    # Send to everyone concurrently, capped to stay within Poke's rate limits
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+
+    async def send(member: dict) -> dict:
         poke_key = member.get("poke_api_key", "")
         if not poke_key:
-            results.append({"name": member["name"], "sent": False, "reason": "No Poke API key"})
-            continue
+            return {"name": member["name"], "sent": False, "reason": "No Poke API key"}
         try:
-            await send_poke_message(poke_key, message)
-            results.append({"name": member["name"], "sent": True})
+            async with semaphore:
+                await send_poke_message(poke_key, message)
+            return {"name": member["name"], "sent": True}
         except Exception as e:
-            results.append({"name": member["name"], "sent": False, "reason": str(e)})
+            return {"name": member["name"], "sent": False, "reason": str(e)}
+
+    results = await asyncio.gather(*(send(m) for m in members))
 
     sent_count = sum(1 for r in results if r["sent"])
     return {
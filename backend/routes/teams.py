@@ -3,28 +3,39 @@ Team management and calendar routes for Multiplayer Poke.
 """
 
 import asyncio
+import uuid
 from datetime import datetime, timedelta
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
-from auth import AuthContext, resolve_auth
+from auth import AuthContext, invalidate_user, resolve_auth
+from cache import TTLCache
 from models import (
     create_user,
     create_team,
     join_team,
     get_team_by_id,
     get_team_by_invite_code,
-    get_team_members,
+    get_team_roster,
     get_user_teams,
     store_availability,
     get_team_availability,
     consume_sync_token,
 )
-from poke_relay import request_team_availability, send_booking_to_team
+from poke_relay import notify_availability, request_team_availability, send_booking_to_team
 
 router = APIRouter(prefix="/teams", tags=["teams"])
 
+# (team, roster, member_ids) by team_id for the membership gate on team routes. Joining
+# a team or changing a Poke key drops the affected entries.
+_MEMBER_CACHE = TTLCache(maxsize=10_000, ttl=60)
+
+# Background availability searches by request_id: {"team_id", "status", "result"}.
+# Kept for a while after finishing so clients can fetch the result.
+_AVAILABILITY_REQUESTS = TTLCache(maxsize=1024, ttl=600)
+_availability_tasks: set[asyncio.Task] = set()
+
 
 # ── Request/Response Models ───────────────────────────────────────────────────
 
@@ -49,6 +60,8 @@ class FindAvailabilityRequest(BaseModel):
     duration_minutes: int = 30
     start_date: str
     end_date: str
+    # False: return a request_id at once and run the search in the background
+    wait: bool = True
 
 
 class BookMeetingRequest(BaseModel):
@@ -64,12 +77,41 @@ class SyncCalendarRequest(BaseModel):
     busy_times: list[dict]
 
 
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+async def require_team_member(
+    team_id: str,
+    auth: AuthContext = Depends(resolve_auth),
+) -> tuple[dict, list[dict]]:
+    """
+    Dependency for /{team_id} routes: returns the team and its members, or
+    raises 404/403 if the caller can't see it.
+    """
+    cached = _MEMBER_CACHE.get(team_id)
+    if cached is None:
+        team = await asyncio.to_thread(get_team_by_id, team_id)
+        if not team:
+            raise HTTPException(status_code=404, detail="Team not found")
+        members = await asyncio.to_thread(get_team_roster, team_id)
+        cached = (team, members, frozenset(m["id"] for m in members))
+        _MEMBER_CACHE.set(team_id, cached)
+    team, members, member_ids = cached
+    if auth.user_id not in member_ids:
+        raise HTTPException(status_code=403, detail="Not a member of this team")
+    return team, members
+
+
+def _forget_members_of(user_id: str):
+    """Drop cached rosters that include the user."""
+    _MEMBER_CACHE.discard_where(lambda cached: user_id in cached[2])
+
+
 # ── Public routes (no auth) ───────────────────────────────────────────────────
 
 @router.post("/users")
 async def register_user(req: CreateUserRequest):
     """Create a new user and get an API key for Poke MCP connection."""
-    user = create_user(name=req.name, email=req.email)
+    user = await asyncio.to_thread(create_user, name=req.name, email=req.email)
     return {
         "user_id": user["id"],
         "name": user["name"],
@@ -81,7 +123,7 @@ async def register_user(req: CreateUserRequest):
 @router.post("/join")
 async def join_team_route(req: JoinTeamRequest):
     """Join a team by invite code. Requires user_id and api_key in headers for auth."""
-    team = get_team_by_invite_code(req.invite_code)
+    team = await asyncio.to_thread(get_team_by_invite_code, req.invite_code)
     if not team:
         raise HTTPException(status_code=404, detail="Invalid invite code")
     # Note: We need auth to know which user is joining. Caller must pass Authorization.
@@ -93,7 +135,8 @@ async def join_team_route(req: JoinTeamRequest):
 @router.post("")
 async def create_team_route(req: CreateTeamRequest, auth: AuthContext = Depends(resolve_auth)):
     """Create a new team. Requires Authorization: Bearer <api_key>."""
-    team = create_team(name=req.name, created_by=auth.user_id)
+    team = await asyncio.to_thread(create_team, name=req.name, created_by=auth.user_id)
+    invalidate_user(auth.user_id)
     return {
         "team_id": team["id"],
         "name": team["name"],
@@ -105,12 +148,14 @@ async def create_team_route(req: CreateTeamRequest, auth: AuthContext = Depends(
 @router.post("/join-with-auth")
 async def join_team_with_auth(req: JoinTeamRequest, auth: AuthContext = Depends(resolve_auth)):
     """Join a team by invite code (authenticated)."""
-    team = get_team_by_invite_code(req.invite_code)
+    team = await asyncio.to_thread(get_team_by_invite_code, req.invite_code)
     if not team:
         raise HTTPException(status_code=404, detail="Invalid invite code")
-    success = join_team(team["id"], auth.user_id)
+    success = await asyncio.to_thread(join_team, team["id"], auth.user_id)
     if not success:
         raise HTTPException(status_code=400, detail="Already a member or join failed")
+    invalidate_user(auth.user_id)
+    _MEMBER_CACHE.pop(team["id"])
     return {
         "team_id": team["id"],
         "team_name": team["name"],
@@ -121,42 +166,25 @@ async def join_team_with_auth(req: JoinTeamRequest, auth: AuthContext = Depends(
 @router.get("/me")
 async def get_my_teams(auth: AuthContext = Depends(resolve_auth)):
     """Get all teams the user belongs to."""
-    teams = get_user_teams(auth.user_id)
+    teams = await asyncio.to_thread(get_user_teams, auth.user_id)
     return {"teams": teams}
 
 
 @router.get("/{team_id}")
-async def get_team(team_id: str, auth: AuthContext = Depends(resolve_auth)):
+async def get_team(membership: tuple[dict, list[dict]] = Depends(require_team_member)):
     """Get team details. User must be a member."""
-    team = get_team_by_id(team_id)
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
-    members = get_team_members(team_id)
-    member_ids = [m["id"] for m in members]
-    if auth.user_id not in member_ids:
-        raise HTTPException(status_code=403, detail="Not a member of this team")
+    team, members = membership
     return {"team": team, "members": members}
 
 
 @router.get("/{team_id}/members")
-async def list_members(team_id: str, auth: AuthContext = Depends(resolve_auth)):
+async def list_members(membership: tuple[dict, list[dict]] = Depends(require_team_member)):
     """List team members with sync status."""
-    team = get_team_by_id(team_id)
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
-    members = get_team_members(team_id)
-    member_ids = [m["id"] for m in members]
-    if auth.user_id not in member_ids:
-        raise HTTPException(status_code=403, detail="Not a member of this team")
-    # Add sync status (has Poke key = can sync)
-    for m in members:
-        m["poke_connected"] = bool(m.get("poke_api_key"))
-        del m["poke_api_key"]  # Don't expose keys
-        del m["api_key"]
+    _, members = membership
     return {"members": members}
 
 
-@router.put("/{team_id}/members/me/poke-key")
+@router.put("/{team_id}/members/me/poke-key", dependencies=[Depends(require_team_member)])
 async def update_my_poke_key(
     team_id: str,
     req: UpdatePokeKeyRequest,
@@ -165,17 +193,13 @@ async def update_my_poke_key(
     """Update the current user's Poke API key for relay messages."""
     from models import update_user_poke_key
 
-    team = get_team_by_id(team_id)
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
-    members = get_team_members(team_id)
-    if auth.user_id not in [m["id"] for m in members]:
-        raise HTTPException(status_code=403, detail="Not a member of this team")
-    update_user_poke_key(auth.user_id, req.poke_api_key)
+    await asyncio.to_thread(update_user_poke_key, auth.user_id, req.poke_api_key)
+    invalidate_user(auth.user_id)
+    _forget_members_of(auth.user_id)
     return {"message": "Poke API key updated. You can now receive calendar sync requests."}
 
 
-@router.post("/{team_id}/availability/find")
+@router.post("/{team_id}/availability/find", dependencies=[Depends(require_team_member)])
 async def find_availability(
     team_id: str,
     req: FindAvailabilityRequest,
@@ -184,38 +208,53 @@ async def find_availability(
     """
     Find free slots for the whole team.
     Triggers Poke relay to all members, polls for reports, computes free slots.
+    With wait=false, responds with a request_id right away; poll
+    GET /{team_id}/availability/{request_id} for the result.
     """
-    team = get_team_by_id(team_id)
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
-    members = get_team_members(team_id)
-    if auth.user_id not in [m["id"] for m in members]:
-        raise HTTPException(status_code=403, detail="Not a member of this team")
-
-    result = await request_team_availability(
+    search = request_team_availability(
         team_id=team_id,
         start_date=req.start_date,
         end_date=req.end_date,
         requesting_user_id=auth.user_id,
         duration_minutes=req.duration_minutes,
     )
-    return result
+    if req.wait:
+        return await search
 
+    request_id = uuid.uuid4().hex
+    _AVAILABILITY_REQUESTS.set(request_id, {"team_id": team_id, "status": "polling", "result": None})
+    task = asyncio.create_task(_run_availability_request(request_id, team_id, search))
+    _availability_tasks.add(task)
+    task.add_done_callback(_availability_tasks.discard)
+    return {"request_id": request_id, "status": "polling"}
 
-@router.post("/{team_id}/book")
+
+async def _run_availability_request(request_id: str, team_id: str, search):
+    try:
+        result = await search
+        state = {"team_id": team_id, "status": "done", "result": result}
+    except Exception as e:
+        print(f"Availability request {request_id} failed: {e}")
+        state = {"team_id": team_id, "status": "failed", "result": {"success": False, "message": str(e)}}
+    _AVAILABILITY_REQUESTS.set(request_id, state)
+
+
+@router.get("/{team_id}/availability/{request_id}", dependencies=[Depends(require_team_member)])
+async def get_availability_request(team_id: str, request_id: str):
+    """Status and, once finished, the result of a background availability search."""
+    state = _AVAILABILITY_REQUESTS.get(request_id)
+    if state is None or state["team_id"] != team_id:
+        raise HTTPException(status_code=404, detail="Unknown or expired availability request")
+    return {"request_id": request_id, "status": state["status"], "result": state["result"]}
+
+
+@router.post("/{team_id}/book", dependencies=[Depends(require_team_member)])
 async def book_meeting(
     team_id: str,
     req: BookMeetingRequest,
     auth: AuthContext = Depends(resolve_auth),
 ):
     """Book a meeting by sending calendar add requests to all team members' Pokes."""
-    team = get_team_by_id(team_id)
-    if not team:
-        raise HTTPException(status_code=404, detail="Team not found")
-    members = get_team_members(team_id)
-    if auth.user_id not in [m["id"] for m in members]:
-        raise HTTPException(status_code=403, detail="Not a member of this team")
-
     result = await send_booking_to_team(
         team_id=team_id,
         title=req.title,
@@ -235,9 +274,10 @@ async def sync_calendar(req: SyncCalendarRequest):
     Uses a one-time sync_token (from the relay message) to identify the user.
     No auth required - the token is the auth.
     """
-    token_data = consume_sync_token(req.sync_token)
+    token_data = await asyncio.to_thread(consume_sync_token, req.sync_token)
     if not token_data:
         raise HTTPException(status_code=400, detail="Invalid or expired sync token")
     user_id = token_data["user_id"]
-    store_availability(user_id, req.start_date, req.end_date, req.busy_times)
+    await asyncio.to_thread(store_availability, user_id, req.start_date, req.end_date, req.busy_times)
+    notify_availability(token_data["team_id"])
     return {"message": "Availability synced", "user_id": user_id}
@@ -3,14 +3,53 @@ Elasticsearch client for Cortex.
 Handles indexing, searching, and embedding via JINA on Elastic Inference Service.
 """
 
+import hashlib
 import os
+import queue
+import threading
 import uuid
+from collections.abc import Iterable
+from concurrent.futures import Future
 from datetime import datetime, timezone
+from functools import lru_cache
 
 import httpx
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, helpers
 
-from .schemas import CATEGORY_INDEX_MAP, INDEX_SCHEMAS
+from cache import TTLCache
+
+from .schemas import ALL_INDICES, CATEGORY_INDEX_MAP, EMBEDDING_FIELD, INDEX_SCHEMAS
+
+# Writes are batched into bulk requests of up to BULK_MAX_DOCS documents. A
+# batch is whatever queued up while the previous one was in flight, so a lone
+# write is sent immediately.
+BULK_MAX_DOCS = 50
+
+# Elasticsearch's cap on a kNN query's num_candidates (and so on k)
+KNN_MAX_CANDIDATES = 10_000
+
+INFERENCE_ID = "jina-embeddings"
+# Ingest pipeline that embeds embed_text server-side, then drops it
+EMBED_PIPELINE = "cortex-embed"
+
+# Each hex digit of the digest maps to a value in [-1, 1]
+_HEX_UNIT = {c: int(c, 16) / 15.0 * 2 - 1 for c in "0123456789abcdef"}
+
+
+@lru_cache(maxsize=4096)
+def _hash_embedding(text: str) -> tuple[float, ...]:
+    """Deterministic 1024-dim vector from the text's SHA-256 (good enough for dev).
+    The 64 digest digits are repeated 16 times. Changing the hash would change
+    every vector and break matching against documents already indexed this way."""
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return tuple(_HEX_UNIT[c] for c in digest) * 16
+
+
+def _source_filter(includes: list[str] | None) -> dict:
+    """_source filter for reads: the requested fields, or everything but the embedding."""
+    if includes:
+        return {"includes": includes}
+    return {"excludes": ["embedding"]}
 
 
 class CortexStorage:
@@ -29,39 +68,100 @@ class CortexStorage:
         else:
             self.es = Elasticsearch(self.es_url)
 
+        # Names of indices known to exist. Indices are only ever created, so
+        # once loaded this saves an existence probe per index on every read.
+        self._existing_indices: set[str] | None = None
+
+        # Embeddings from the inference service by input text. Search queries
+        # and summaries repeat, and each miss is a network round trip.
+        self._embeddings = TTLCache(maxsize=4096, ttl=3600)
+
+        # Pending writes for the bulk worker, started on the first store()
+        self._bulk_queue: queue.Queue[tuple[dict, Future]] = queue.Queue()
+        self._bulk_thread: threading.Thread | None = None
+        self._bulk_lock = threading.Lock()
+
+        # Whether writes embed through EMBED_PIPELINE; set by initialize_indices
+        self._embed_in_pipeline = False
+
     def initialize_indices(self):
         """Create all indices if they don't exist."""
+        # One metadata request for all of them instead of a probe per index
+        existing = self.es.indices.get(index=",".join(INDEX_SCHEMAS), ignore_unavailable=True)
         for index_name, schema in INDEX_SCHEMAS.items():
-            if not self.es.indices.exists(index=index_name):
+            if index_name not in existing:
                 self.es.indices.create(index=index_name, body=schema)
                 print(f"Created index: {index_name}")
-            else:
-                print(f"Index already exists: {index_name}")
+                continue
+            print(f"Index already exists: {index_name}")
+            embedding = existing[index_name].get("mappings", {}).get("properties", {}).get("embedding", {})
+            if embedding.get("index_options", {}).get("type") != EMBEDDING_FIELD["index_options"]["type"]:
+                self._quantize_embeddings(index_name)
+        self._existing_indices = set(INDEX_SCHEMAS)
+        self._embed_in_pipeline = self._put_embed_pipeline()
+
+    def _quantize_embeddings(self, index_name: str):
+        """Switch an older index's embedding field to int8_hnsw. Elasticsearch
+        allows this in place; segments written from then on are quantized."""
+        try:
+            self.es.indices.put_mapping(index=index_name, properties={"embedding": EMBEDDING_FIELD})
+        except Exception as e:
+            print(f"Could not update embedding mapping on {index_name}: {e}")
+
+    def _put_embed_pipeline(self) -> bool:
+        """
+        Install the ingest pipeline that embeds documents during indexing, so
+        store() doesn't need its own inference round trip. Only possible when
+        the inference endpoint exists; otherwise store() keeps embedding
+        client-side with the hash fallback.
+        """
+        try:
+            self.es.inference.get(inference_id=INFERENCE_ID)
+            self.es.ingest.put_pipeline(
+                id=EMBED_PIPELINE,
+                processors=[
+                    {
+                        "inference": {
+                            "model_id": INFERENCE_ID,
+                            "input_output": [{"input_field": "embed_text", "output_field": "embedding"}],
+                            # An inference outage shouldn't fail the write:
+                            # index the entry without an embedding instead
+                            "on_failure": [{"remove": {"field": "embed_text", "ignore_missing": True}}],
+                        }
+                    },
+                    {"remove": {"field": "embed_text", "ignore_missing": True}},
+                ],
+            )
+        except Exception as e:
+            print(f"Embedding at index time unavailable, embedding client-side: {e}")
+            return False
+        return True
+
+    def _filter_existing(self, indices: Iterable[str]) -> list[str]:
+        """Keep only the indices that exist, loading the set with one request if needed."""
+        if self._existing_indices is None:
+            self._existing_indices = set(self.es.indices.get(index="cortex-*"))
+        return [idx for idx in indices if idx in self._existing_indices]
 
     def _get_embedding(self, text: str) -> list[float]:
         """Get JINA embedding for text via Elastic Inference Service.
         Falls back to a simple hash-based embedding for local dev."""
+        cached = self._embeddings.get(text)
+        if cached is not None:
+            return list(cached)
         try:
             # Try Elastic Inference Service (JINA v3)
             response = self.es.inference.inference(
-                inference_id="jina-embeddings",
+                inference_id=INFERENCE_ID,
                 body={"input": [text]},
             )
-            return response["data"][0]["embedding"]
+            embedding = response["data"][0]["embedding"]
         except Exception:
             # Fallback: use Anthropic-compatible embedding or a simple approach
             # For hackathon, we'll use a deterministic hash-based vector as fallback
-            import hashlib
-            h = hashlib.sha256(text.encode()).hexdigest()
-            # Generate a 1024-dim vector from hash (good enough for dev)
-            vec = []
-            for i in range(0, min(len(h), 64), 1):
-                val = int(h[i], 16) / 15.0 * 2 - 1  # normalize to [-1, 1]
-                vec.append(val)
-            # Pad to 1024
-            while len(vec) < 1024:
-                vec.extend(vec[:min(len(vec), 1024 - len(vec))])
-            return vec[:1024]
+            return list(_hash_embedding(text))
+        self._embeddings.set(text, tuple(embedding))
+        return embedding
 
     def store(self, entry: dict) -> dict:
         """Store a classified entry in the appropriate index."""
@@ -69,66 +169,119 @@ class CortexStorage:
         index_name = CATEGORY_INDEX_MAP.get(category, "cortex-notes")
 
         # Add metadata
-        entry["id"] = str(uuid.uuid4())
+        entry["id"] = uuid.uuid4().hex
         entry["created_at"] = datetime.now(timezone.utc).isoformat()
         entry["updated_at"] = entry["created_at"]
 
-        # Generate embedding from raw input + summary
-        embed_text = f"{entry.get('summary', '')} {entry.get('raw_input', '')}"
-        entry["embedding"] = self._get_embedding(embed_text)
+        # Generate embedding from summary + raw input. Parts are stripped so
+        # identical content shares an embedding cache key; an entry with
+        # neither is stored without one.
+        parts = ((entry.get("summary") or "").strip(), (entry.get("raw_input") or "").strip())
+        embed_text = " ".join(part for part in parts if part)
+        action = {"_index": index_name, "_id": entry["id"], "_source": entry}
+        if embed_text and self._embed_in_pipeline:
+            entry["embed_text"] = embed_text
+            action["pipeline"] = EMBED_PIPELINE
+        elif embed_text:
+            entry["embedding"] = self._get_embedding(embed_text)
 
-        # Index in Elasticsearch
-        self.es.index(index=index_name, id=entry["id"], document=entry)
+        # Index in Elasticsearch, batched with any concurrent writes
+        try:
+            self._enqueue(action).result()
+        finally:
+            entry.pop("embed_text", None)
+        if self._existing_indices is not None:
+            self._existing_indices.add(index_name)  # auto-created on first write
 
         return {"id": entry["id"], "index": index_name, "category": category}
 
-    def search(self, query: str, categories: list[str] | None = None, limit: int = 10) -> list[dict]:
-        """Semantic search across all or specific category indices."""
+    def _enqueue(self, action: dict) -> Future:
+        """Queue a bulk index action. The future resolves once the document is indexed."""
+        future = Future()
+        self._bulk_queue.put((action, future))
+        with self._bulk_lock:
+            if self._bulk_thread is None:
+                self._bulk_thread = threading.Thread(target=self._bulk_worker, name="es-bulk", daemon=True)
+                self._bulk_thread.start()
+        return future
+
+    def _bulk_worker(self):
+        while True:
+            batch = [self._bulk_queue.get()]
+            while len(batch) < BULK_MAX_DOCS:
+                try:
+                    batch.append(self._bulk_queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch: list[tuple[dict, Future]]):
+        """Index a batch with one bulk request and settle each document's future."""
+        try:
+            _, errors = helpers.bulk(self.es, [action for action, _ in batch], raise_on_error=False)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        failed = {}
+        for item in errors:
+            info = next(iter(item.values()))
+            failed[info.get("_id")] = info.get("error")
+        for action, future in batch:
+            if action["_id"] in failed:
+                future.set_exception(RuntimeError(f"Indexing failed: {failed[action['_id']]}"))
+            else:
+                future.set_result(None)
+
+    def search(
+        self,
+        query: str,
+        categories: list[str] | None = None,
+        limit: int = 10,
+        source_includes: list[str] | None = None,
+    ) -> list[dict]:
+        """Semantic search across all or specific category indices.
+        Pass source_includes to fetch only those fields of each hit."""
+        if limit <= 0:
+            return []
         if categories:
-            indices = [CATEGORY_INDEX_MAP[c] for c in categories if c in CATEGORY_INDEX_MAP]
+            indices = (CATEGORY_INDEX_MAP[c] for c in categories if c in CATEGORY_INDEX_MAP)
         else:
-            indices = list(CATEGORY_INDEX_MAP.values())
+            indices = ALL_INDICES
+
+        existing_indices = self._filter_existing(indices)
+        if not existing_indices:
+            return []
 
-        index_str = ",".join(indices)
         query_embedding = self._get_embedding(query)
+        # Elasticsearch rejects k < 1 and more than KNN_MAX_CANDIDATES candidates
+        k = min(limit, KNN_MAX_CANDIDATES)
 
+        # Hybrid search: approximate kNN over the HNSW-indexed embeddings plus
+        # keyword matching; Elasticsearch sums the two scores per hit
         body = {
-            "size": limit,
+            "size": k,
+            "knn": {
+                "field": "embedding",
+                "query_vector": query_embedding,
+                "k": k,
+                "num_candidates": min(KNN_MAX_CANDIDATES, max(50, k * 5)),
+            },
             "query": {
-                "bool": {
-                    "should": [
-                        # Semantic search via embedding
-                        {
-                            "script_score": {
-                                "query": {"match_all": {}},
-                                "script": {
-                                    "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                                    "params": {"query_vector": query_embedding},
-                                },
-                            }
-                        },
-                        # Text search for keyword matching
-                        {
-                            "multi_match": {
-                                "query": query,
-                                "fields": ["title^2", "content", "description", "summary", "raw_input", "product", "name"],
-                                "type": "best_fields",
-                                "boost": 0.5,
-                            }
-                        },
-                    ]
+                "multi_match": {
+                    "query": query,
+                    "fields": ["title^2", "content", "description", "summary", "raw_input", "product", "name"],
+                    "type": "best_fields",
+                    "boost": 0.5,
                 }
             },
-            "_source": {"excludes": ["embedding"]},
+            "_source": _source_filter(source_includes),
         }
 
-        # Check which indices actually exist before searching
-        existing_indices = [idx for idx in indices if self.es.indices.exists(index=idx)]
-        if not existing_indices:
-            return []
-
+        # ignore_unavailable covers an index deleted behind the cache's back
         index_str = ",".join(existing_indices)
-        response = self.es.search(index=index_str, body=body)
+        response = self.es.search(index=index_str, body=body, ignore_unavailable=True)
 
         results = []
         for hit in response["hits"]["hits"]:
@@ -139,14 +292,20 @@ class CortexStorage:
 
         return results
 
-    def get_entries(self, category: str | None = None, limit: int = 50) -> list[dict]:
-        """Get recent entries, optionally filtered by category."""
+    def get_entries(
+        self,
+        category: str | None = None,
+        limit: int = 50,
+        source_includes: list[str] | None = None,
+    ) -> list[dict]:
+        """Get recent entries, optionally filtered by category.
+        Pass source_includes to fetch only those fields of each entry."""
         if category:
-            indices = [CATEGORY_INDEX_MAP.get(category, "cortex-notes")]
+            indices = (CATEGORY_INDEX_MAP.get(category, "cortex-notes"),)
         else:
-            indices = list(CATEGORY_INDEX_MAP.values())
+            indices = ALL_INDICES
 
-        existing_indices = [idx for idx in indices if self.es.indices.exists(index=idx)]
+        existing_indices = self._filter_existing(indices)
         if not existing_indices:
             return []
 
@@ -155,10 +314,10 @@ class CortexStorage:
         body = {
             "size": limit,
             "sort": [{"created_at": {"order": "desc"}}],
-            "_source": {"excludes": ["embedding"]},
+            "_source": _source_filter(source_includes),
         }
 
-        response = self.es.search(index=index_str, body=body)
+        response = self.es.search(index=index_str, body=body, ignore_unavailable=True)
 
         results = []
         for hit in response["hits"]["hits"]:
@@ -0,0 +1,96 @@
+"""
+In-memory fallback store for Cortex.
+Used when Elasticsearch is unavailable. Keeps an inverted token index
+alongside the entries so lookups don't rescan every stored entry.
+"""
+
+import re
+
+import orjson
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _tokenize(text: str) -> set[str]:
+    return set(_TOKEN_RE.findall(text.lower()))
+
+
+class MemoryStore:
+    """Bounded, insertion-ordered entries with an incrementally built token index.
+    Once maxlen entries are stored, the oldest is evicted on each append."""
+
+    def __init__(self, maxlen: int = 10_000):
+        self.maxlen = maxlen
+        self._next_id = 0
+        self._entries: dict[int, dict] = {}
+        # Per-entry lowercased JSON and token set, computed once on append
+        self._blobs: dict[int, str] = {}
+        self._tokens: dict[int, frozenset[str]] = {}
+        self._index: dict[str, set[int]] = {}
+
+    def append(self, entry: dict):
+        """Store an entry and index its tokens."""
+        entry_id = self._next_id
+        self._next_id += 1
+        blob = orjson.dumps(entry).decode().lower()
+        tokens = frozenset(_tokenize(blob))
+        self._entries[entry_id] = entry
+        self._blobs[entry_id] = blob
+        self._tokens[entry_id] = tokens
+        for token in tokens:
+            self._index.setdefault(token, set()).add(entry_id)
+
+        if len(self._entries) > self.maxlen:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, entry_id: int):
+        del self._entries[entry_id]
+        del self._blobs[entry_id]
+        for token in self._tokens.pop(entry_id):
+            postings = self._index[token]
+            postings.discard(entry_id)
+            if not postings:
+                del self._index[token]
+
+    def search(self, query: str, limit: int = 5) -> list[dict]:
+        """Return entries containing any of the query's words.
+        Entries matching more of the words rank first; ties keep insertion order."""
+        q = frozenset(_tokenize(query))
+        hits: set[int] = set()
+        for token in q:
+            hits |= self._index.get(token, set())
+        ranked = sorted(hits, key=lambda entry_id: (-len(self._tokens[entry_id] & q), entry_id))
+        return [self._entries[entry_id] for entry_id in ranked[:limit]]
+
+    def find(self, phrase: str, limit: int = 10) -> list[dict]:
+        """Return entries whose JSON contains the phrase (case-insensitive), oldest first."""
+        phrase = phrase.lower()
+        # A word with non-word characters on both sides inside the phrase must
+        # appear as a whole token in any matching entry, so the index narrows
+        # the candidates and the substring check only confirms them.
+        words = {
+            m.group() for m in _TOKEN_RE.finditer(phrase)
+            if m.start() > 0 and m.end() < len(phrase)
+        }
+        if words:
+            postings = sorted((self._index.get(word, set()) for word in words), key=len)
+            candidates = sorted(set.intersection(*postings))
+        else:
+            candidates = self._blobs
+
+        results = []
+        for entry_id in candidates:
+            if phrase in self._blobs[entry_id]:
+                results.append(self._entries[entry_id])
+                if len(results) >= limit:
+                    break
+        return results
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getitem__(self, key):
+        return list(self._entries.values())[key]
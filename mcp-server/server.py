@@ -4,6 +4,7 @@ Exposes tools for team calendar coordination, shared brain, and more.
 Each user connects Poke with their API key (from team dashboard).
 """
 
+import asyncio
 import os
 import json
 import httpx
@@ -34,16 +35,49 @@ def _headers(api_key: str | None = None):
     return {"Authorization": f"Bearer {key}"}
 
 
+# Shared across tool calls so requests reuse pooled HTTP/2 connections to the
+# backend. Created on first use, inside the server's event loop; it lives as
+# long as the process.
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=CORTEX_API,
+            http2=True,
+            timeout=60.0,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        )
+    return _client
+
+
 async def _call(method: str, path: str, data: dict | None = None, api_key: str | None = None) -> dict:
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        url = f"{CORTEX_API}{path}"
-        headers = _headers(api_key)
-        if method == "GET":
-            resp = await client.get(url, params=data, headers=headers)
-        else:
-            resp = await client.post(url, json=data, headers=headers)
-        resp.raise_for_status()
-        return resp.json()
+    headers = _headers(api_key)
+    if method == "GET":
+        resp = await _get_client().get(path, params=data, headers=headers)
+    else:
+        resp = await _get_client().post(path, json=data, headers=headers)
+    resp.raise_for_status()
+    return resp.json()
+
+
+# Fire-and-forget calls. Holding a reference keeps a task from being garbage
+# collected before it finishes.
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_done)
+
+
+def _background_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        print(f"Background call failed: {task.exception()}")
 
 
 # ── Team Calendar Tools ───────────────────────────────────────────────────────
@@ -237,9 +271,11 @@ async def get_team_status(api_key: str = "") -> str:
         if not team_list:
             return "You're not in a team. Create or join one at the dashboard."
         team_id = team_list[0]["id"]
-        team_data = await _call("GET", f"/teams/{team_id}/members", api_key=key)
+        team_data, entries = await asyncio.gather(
+            _call("GET", f"/teams/{team_id}/members", api_key=key),
+            _call("GET", "/entries", {"limit": 10}, api_key=key),
+        )
         members = team_data.get("members", [])
-        entries = await _call("GET", "/entries", {"limit": 10}, api_key=key)
         ent_list = entries.get("entries", [])
 
         parts = [f"Team: {team_list[0]['name']}\n", f"Members ({len(members)}):"]
@@ -311,7 +347,8 @@ async def get_shopping_list() -> str:
 async def shop(product_query: str) -> str:
     """Search for products (Visa commerce prize - Stagehand automation)."""
     try:
-        await _call("POST", "/dump", {"text": f"I want to buy: {product_query}"})
+        # Recording the intent doesn't affect the reply, so don't wait for it
+        _in_background(_call("POST", "/dump", {"text": f"I want to buy: {product_query}"}))
         result = await _call("POST", "/shop", {"query": product_query})
         return result.get("comparison", json.dumps(result))
     except Exception as e:
@@ -319,6 +356,13 @@ async def shop(product_query: str) -> str:
 
 
 if __name__ == "__main__":
+    try:
+        # Faster event loop for the HTTP-heavy tool calls, where available
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
     port = int(os.getenv("PORT", 8001))
     mcp.run(
         transport="http",